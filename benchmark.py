@@ -0,0 +1,463 @@
+# -*- coding: utf-8 -*-
+"""End-to-end benchmark of mlmc_class.py with tiny, randomly initialized models.
+
+Nothing is downloaded: the BERT, XLNet and GPT-2 tokenizers are built from the bundled sample
+TSVs and the models are created from small configs. Every case then goes through the same code
+as `mlmc_class.main`: `DataProcessor`, `convert_examples_to_features`, `train`, `evaluate` and
+`metrics_frame`. Time, throughput and peak memory are reported per stage as JSON, and compared
+against a stored baseline to flag regressions.
+"""
+
+import argparse
+import importlib.util
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+import transformers
+from sklearn.exceptions import UndefinedMetricWarning
+from torch.utils.data import DataLoader, RandomSampler, SequentialSampler
+from transformers import BertConfig, BertTokenizer, BertForSequenceClassification
+from transformers import XLNetConfig, XLNetTokenizer, XLNetForSequenceClassification
+from transformers import GPT2Config, GPT2Tokenizer
+
+import mlmc_class
+from mlmc_class import (DataProcessor, convert_examples_to_features, build_dataset, build_optimizer, train, evaluate,
+                        metrics_frame, GPT2ForSequenceClassification, BertForMultiLabelSequenceClassification,
+                        XLNetForMultiLabelSequenceClassification)
+from benchmark_report import summarize, compare, baseline_mismatches
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DATASETS = ["binary_sample", "multiclass_sample", "multilabel_sample"]
+MODELS = ["bert", "xlnet", "gpt2"]
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmark_baseline.json")
+
+# GPT2ForMultiLabelSequenceClassification reads `hidden_dropout_prob`, which GPT2Config does not
+# have, so it cannot be built (from a config or from a checkpoint).
+SKIPPED = {
+    ("gpt2", "multilabel_sample"): "GPT2ForMultiLabelSequenceClassification cannot be instantiated",
+}
+
+
+def write_bert_vocab(texts, out_dir, vocab_size):
+    """Writes a WordPiece vocab made of the most frequent lower-cased words and punctuation."""
+    counts = Counter(w for text in texts for w in re.findall(r"\w+|[^\w\s]", text.lower()))
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+    vocab += [w for w, _ in counts.most_common(vocab_size - len(vocab))]
+    with open(os.path.join(out_dir, "vocab.txt"), "w", encoding="utf-8") as writer:
+        writer.write("\n".join(vocab) + "\n")
+
+
+def write_xlnet_vocab(texts, out_dir, vocab_size):
+    """Trains a small SentencePiece model with the XLNet special tokens."""
+    import sentencepiece as spm
+
+    corpus_file = os.path.join(out_dir, "corpus.txt")
+    with open(corpus_file, "w", encoding="utf-8") as writer:
+        for text in texts:
+            writer.write(text.lower().replace("\n", " ") + "\n")
+    spm.SentencePieceTrainer.Train(
+        "--input={} --model_prefix={} --vocab_size={} --hard_vocab_limit=false "
+        "--user_defined_symbols=<pad>,<cls>,<sep>,<mask>,<eod>,<eop>".format(
+            corpus_file, os.path.join(out_dir, "spiece"), vocab_size))
+
+
+def write_gpt2_vocab(out_dir):
+    """Writes a byte-level BPE vocab without merges, i.e. one token per byte."""
+    try:
+        from transformers.models.gpt2.tokenization_gpt2 import bytes_to_unicode
+    except ImportError:
+        from transformers.tokenization_gpt2 import bytes_to_unicode
+
+    vocab = {c: i for i, c in enumerate(bytes_to_unicode().values())}
+    vocab["<|endoftext|>"] = len(vocab)
+    with open(os.path.join(out_dir, "vocab.json"), "w", encoding="utf-8") as writer:
+        json.dump(vocab, writer)
+    with open(os.path.join(out_dir, "merges.txt"), "w", encoding="utf-8") as writer:
+        writer.write("#version: 0.2\n")
+
+
+def write_tokenizer_files(models, texts, out_dir, vocab_size):
+    """Writes the tokenizer files of each model under `out_dir/<model>`."""
+    writers = {
+        "bert": lambda d: write_bert_vocab(texts, d, vocab_size),
+        "xlnet": lambda d: write_xlnet_vocab(texts, d, vocab_size),
+        "gpt2": write_gpt2_vocab,
+    }
+    for model_type in models:
+        model_dir = os.path.join(out_dir, model_type)
+        os.makedirs(model_dir)
+        writers[model_type](model_dir)
+
+
+def load_tokenizer(model_type, tokenizer_dir):
+    """Loads a tokenizer written by `write_tokenizer_files`, set up like in `mlmc_class.main`."""
+    if model_type == "bert":
+        return BertTokenizer(os.path.join(tokenizer_dir, "vocab.txt"), do_lower_case=True)
+    if model_type == "xlnet":
+        return XLNetTokenizer(os.path.join(tokenizer_dir, "spiece.model"), do_lower_case=True)
+    tokenizer = GPT2Tokenizer(os.path.join(tokenizer_dir, "vocab.json"), os.path.join(tokenizer_dir, "merges.txt"))
+    tokenizer.add_special_tokens({'cls_token': '[CLS]'})
+    return tokenizer
+
+
+def build_model(model_type, tokenizer, num_labels, multi_label, args):
+    """Creates a randomly initialized model, mirroring the model selection in `mlmc_class.main`."""
+    if model_type == "bert":
+        config = BertConfig(vocab_size=len(tokenizer), hidden_size=args.hidden_size,
+                            num_hidden_layers=args.num_layers, num_attention_heads=args.num_heads,
+                            intermediate_size=4 * args.hidden_size, max_position_embeddings=args.max_seq_length,
+                            num_labels=num_labels)
+        model_class = BertForMultiLabelSequenceClassification if multi_label else BertForSequenceClassification
+        return model_class(config)
+    if model_type == "xlnet":
+        config = XLNetConfig(vocab_size=len(tokenizer), d_model=args.hidden_size, n_layer=args.num_layers,
+                             n_head=args.num_heads, d_inner=4 * args.hidden_size, num_labels=num_labels)
+        model_class = XLNetForMultiLabelSequenceClassification if multi_label else XLNetForSequenceClassification
+        return model_class(config)
+    config = GPT2Config(vocab_size=tokenizer.vocab_size, n_positions=args.max_seq_length, n_embd=args.hidden_size,
+                        n_layer=args.num_layers, n_head=args.num_heads, num_labels=num_labels)
+    model = GPT2ForSequenceClassification(config)
+    model.gpt2.resize_token_embeddings(len(tokenizer))
+    model.set_type(args.gpt2_classification_type)
+    return model
+
+
+def rss_mb():
+    """Current resident set size of the process, in MB, or None when it cannot be read."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    try:
+        with open("/proc/self/statm") as reader:
+            pages = int(reader.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+class RssSampler(threading.Thread):
+    """Samples the resident set size in the background, to get the peak memory of a single stage.
+
+    The peak RSS reported by the OS is the highest value since the process started, so it cannot tell
+    stages apart. The sampling thread competes with the stage for the GIL, so it only runs in the memory
+    pass, never while stages are timed.
+    """
+
+    def __init__(self, interval=0.005):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.start_mb = rss_mb()
+        self.peak_mb = self.start_mb
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self._sample()
+
+    def _sample(self):
+        current = rss_mb()
+        if current is not None and (self.peak_mb is None or current > self.peak_mb):
+            self.peak_mb = current
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self._sample()
+
+
+def run_stage(stages, name, items, device, measure_memory, fn, *args):
+    """Runs `fn(*args)` and records it under `stages[name]`.
+
+    Without `measure_memory` the duration and throughput are recorded. With it, the memory of the stage
+    is recorded instead: `peak_rss_mb` is the highest RSS seen during the stage, `rss_growth_mb` how much
+    it rose above the RSS at the start of the stage and `cuda_peak_mb` the peak CUDA allocation.
+    """
+    use_cuda = device.type == "cuda"
+    if use_cuda:
+        torch.cuda.synchronize(device)
+        if measure_memory:
+            torch.cuda.reset_peak_memory_stats(device)
+    sampler = None
+    if measure_memory:
+        sampler = RssSampler()
+        sampler.start()
+    start = time.perf_counter()
+    try:
+        result = fn(*args)
+        if use_cuda:
+            torch.cuda.synchronize(device)
+    finally:
+        seconds = time.perf_counter() - start
+        if sampler is not None:
+            sampler.stop()
+    if measure_memory:
+        stages[name] = {"peak_rss_mb": sampler.peak_mb,
+                        "rss_growth_mb": sampler.peak_mb - sampler.start_mb if sampler.start_mb is not None else None,
+                        "cuda_peak_mb": torch.cuda.max_memory_allocated(device) / (1024 * 1024) if use_cuda else None}
+    else:
+        n = items(result) if callable(items) else items
+        stages[name] = {"seconds": seconds,
+                        "items": n,
+                        "items_per_second": n / seconds if seconds > 0 else None}
+    return result
+
+
+def run_case(model_type, dataset, tokenizer, device, args, measure_memory=False):
+    """Runs one model on one dataset, stage by stage. Returns the stage measurements and the scores."""
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+    torch.manual_seed(args.seed)
+
+    train_file = os.path.join(ROOT, dataset, "train.tsv")
+    eval_file = os.path.join(ROOT, dataset, "dev.tsv")
+    dp = DataProcessor()
+    stages = {}
+
+    def read():
+        return dp.get_train_examples(train_file), dp.get_dev_examples(eval_file)
+
+    train_examples, eval_examples = run_stage(stages, "read", lambda r: len(r[0]) + len(r[1]), device, measure_memory,
+                                              read)
+    labels = run_stage(stages, "labels", len(train_examples) + len(eval_examples), device, measure_memory,
+                       dp.get_labels, train_file, eval_file)
+    all_labels = [i.labels for i in train_examples] + [i.labels for i in eval_examples]
+    multi_label = not all([len(label) == 1 for label in all_labels])
+    train_examples = train_examples[:args.max_train_examples]
+    eval_examples = eval_examples[:args.max_eval_examples]
+
+    train_features = run_stage(stages, "train_features", len(train_examples), device, measure_memory,
+                               convert_examples_to_features, train_examples, labels, args.max_seq_length, tokenizer,
+                               model_type == "gpt2")
+    model = run_stage(stages, "model_init", 1, device, measure_memory,
+                      build_model, model_type, tokenizer, len(labels), multi_label, args)
+    model.to(device)
+
+    def fit():
+        train_data = build_dataset(train_features)
+        train_dataloader = DataLoader(train_data, sampler=RandomSampler(train_data),
+                                      batch_size=args.train_batch_size)
+        optimizer = build_optimizer(model, args.learning_rate)
+        return train(model, train_dataloader, optimizer, args.num_train_epochs, device)
+
+    global_step, loss = run_stage(stages, "train", len(train_features) * int(args.num_train_epochs), device,
+                                  measure_memory, fit)
+
+    # mlmc_class.main converts the eval examples without the gpt2 flag; do the same.
+    eval_features = run_stage(stages, "eval_features", len(eval_examples), device, measure_memory,
+                              convert_examples_to_features, eval_examples, labels, args.max_seq_length, tokenizer)
+
+    def predict():
+        eval_data = build_dataset(eval_features)
+        eval_dataloader = DataLoader(eval_data, sampler=SequentialSampler(eval_data),
+                                     batch_size=args.eval_batch_size)
+        return evaluate(model, eval_dataloader, device, args.gpu, multi_label, args.prob_threshold)
+
+    eval_loss, preds, out_label_ids = run_stage(stages, "eval", len(eval_features), device, measure_memory, predict)
+    metrics = run_stage(stages, "metrics", len(eval_features), device, measure_memory,
+                        metrics_frame, preds, out_label_ids, labels)
+
+    scores = {"loss": loss, "eval_loss": eval_loss, "global_step": global_step,
+              "F1 score, Micro": metrics["F1 score, Micro"], "F1 score, Macro": metrics["F1 score, Macro"]}
+    return stages, scores
+
+
+def setup(args):
+    """Configures logging, warnings and torch threads; done again in each case process."""
+    if not args.verbose:
+        logging.getLogger(mlmc_class.__name__).setLevel(logging.WARNING)
+    warnings.filterwarnings("ignore", category=UndefinedMetricWarning)
+    torch.set_num_threads(args.threads)
+    return torch.device('cpu') if args.gpu == -1 else torch.device('cuda:' + str(args.gpu))
+
+
+def run_case_process(model_type, dataset, tokenizer_dir, args, measure_memory):
+    """Runs the timing pass or the memory pass of a case. Returns the stage measurements of each run and the scores.
+
+    The timing pass runs the case `args.warmup` times without recording anything, then `args.repeats` times. The memory pass runs it once, so that its RSS figures
+    come from a process where nothing ran before.
+    """
+    device = setup(args)
+    tokenizer = load_tokenizer(model_type, tokenizer_dir)
+    if measure_memory:
+        stages, scores = run_case(model_type, dataset, tokenizer, device, args, measure_memory=True)
+        return [stages], scores
+    for _ in range(args.warmup):
+        run_case(model_type, dataset, tokenizer, device, args)
+    runs = []
+    for _ in range(args.repeats):
+        stages, scores = run_case(model_type, dataset, tokenizer, device, args)
+        runs.append(stages)
+    return runs, scores
+
+
+def run_in_process(*args):
+    """Calls `run_case_process(*args)` in a new process, so that no case sees the heap left by another one."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(run_case_process, *args).result()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+
+    parser.add_argument("--models", nargs="+", default=MODELS, choices=MODELS,
+                        help="Models to benchmark.")
+    parser.add_argument("--datasets", nargs="+", default=DATASETS, choices=DATASETS,
+                        help="Bundled sample datasets to benchmark on.")
+    parser.add_argument("--max_train_examples",
+                        default=1024,
+                        type=int,
+                        help="Number of training examples used for the feature and training stages.")
+    parser.add_argument("--max_eval_examples",
+                        default=512,
+                        type=int,
+                        help="Number of evaluation examples used for the feature, evaluation and metrics stages.")
+    parser.add_argument("--max_seq_length",
+                        default=64,
+                        type=int,
+                        help="The maximum total input sequence length after tokenization.")
+    parser.add_argument("--train_batch_size",
+                        default=32,
+                        type=int,
+                        help="Total batch size for training.")
+    parser.add_argument("--eval_batch_size",
+                        default=32,
+                        type=int,
+                        help="Total batch size for eval.")
+    parser.add_argument("--learning_rate",
+                        default=2e-5,
+                        type=float,
+                        help="The initial learning rate for Adam.")
+    parser.add_argument("--num_train_epochs",
+                        default=1.0,
+                        type=float,
+                        help="Total number of training epochs to perform.")
+    parser.add_argument("--prob_threshold",
+                        default=0.5,
+                        type=float,
+                        help="Probabilty threshold for multiabel classification.")
+    parser.add_argument("--gpt2_classification_type", default="mean", type=str,
+                        help="GPT-2 classification type selected in the list: mean, sum, last, first, max, min")
+    parser.add_argument("--hidden_size", default=32, type=int, help="Hidden size of the tiny models.")
+    parser.add_argument("--num_layers", default=2, type=int, help="Number of layers of the tiny models.")
+    parser.add_argument("--num_heads", default=2, type=int, help="Number of attention heads of the tiny models.")
+    parser.add_argument("--vocab_size", default=2000, type=int,
+                        help="Vocabulary size of the BERT and XLNet tokenizers built from the samples.")
+    parser.add_argument("--gpu", default=-1, type=int, help="GPU to be used, -1 for CPU.")
+    parser.add_argument("--threads", default=1, type=int, help="Number of CPU threads used by torch.")
+    parser.add_argument("--seed", default=42, type=int, help="Random seed.")
+    parser.add_argument("--warmup", default=1, type=int,
+                        help="Number of runs of each case done before the timed runs, and discarded.")
+    parser.add_argument("--repeats", default=5, type=int,
+                        help="Number of timed runs of each case. The fastest time of each stage is reported.")
+    parser.add_argument("--output", default=None, type=str, help="Write the JSON report here instead of stdout.")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, type=str,
+                        help="Baseline JSON report to compare against, if it exists.")
+    parser.add_argument("--save_baseline", action="store_true",
+                        help="Store this run as the new baseline instead of comparing against it.")
+    parser.add_argument("--tolerance", default=0.2, type=float,
+                        help="Relative slowdown or memory increase over the baseline reported as a regression.")
+    parser.add_argument("--min_seconds", default=0.05, type=float,
+                        help="Time differences smaller than this are never reported as a regression.")
+    parser.add_argument("--min_mb", default=5.0, type=float,
+                        help="Memory differences smaller than this, in MB, are never reported as a regression.")
+    parser.add_argument("--force_compare", action="store_true",
+                        help="Compare against a baseline recorded with other settings or in another environment.")
+    parser.add_argument("--verbose", action="store_true", help="Keep the INFO logs of mlmc_class.")
+
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    device = setup(args)
+
+    settings = {k: v for k, v in vars(args).items()
+                if k not in ("output", "baseline", "save_baseline", "tolerance", "min_seconds", "min_mb",
+                              "force_compare", "verbose")}
+    results = {"environment": {"python": platform.python_version(),
+                               "platform": platform.platform(),
+                               "processor": platform.processor(),
+                               "torch": torch.__version__,
+                               "transformers": transformers.__version__,
+                               "device": str(device)},
+               "settings": settings,
+               "cases": {}}
+
+    skipped = dict(SKIPPED)
+    if "xlnet" in args.models and importlib.util.find_spec("sentencepiece") is None:
+        logger.warning("sentencepiece is not installed, the XLNet cases are skipped")
+        skipped.update({("xlnet", dataset): "sentencepiece is not installed" for dataset in DATASETS})
+    models = [m for m in args.models if not all((m, dataset) in skipped for dataset in args.datasets)]
+
+    dp = DataProcessor()
+    texts = [str(example.text_a) for dataset in DATASETS
+             for example in dp.get_train_examples(os.path.join(ROOT, dataset, "train.tsv"))]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        write_tokenizer_files(models, texts, tmp_dir, args.vocab_size)
+        for model_type in args.models:
+            for dataset in args.datasets:
+                case = model_type + "/" + dataset
+                if (model_type, dataset) in skipped:
+                    results["cases"][case] = {"skipped": skipped[(model_type, dataset)]}
+                    continue
+                logger.info("Benchmarking %s", case)
+                tokenizer_dir = os.path.join(tmp_dir, model_type)
+                runs, scores = run_in_process(model_type, dataset, tokenizer_dir, args, False)
+                memory, _ = run_in_process(model_type, dataset, tokenizer_dir, args, True)
+                stages = summarize(runs, memory[0])
+                results["cases"][case] = {"stages": stages,
+                                          "total_seconds": sum(s["seconds"] for s in stages.values()),
+                                          "scores": scores}
+
+    status = 0
+    if args.save_baseline:
+        with open(args.baseline, "w") as writer:
+            json.dump(results, writer, indent=2)
+        logger.info("Baseline written to %s", args.baseline)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as reader:
+            baseline = json.load(reader)
+        mismatches = baseline_mismatches(results, baseline)
+        if mismatches and not args.force_compare:
+            logger.error("Not comparing with %s, it was recorded with other %s. Record a new baseline with "
+                         "--save_baseline, or use --force_compare", args.baseline, ", ".join(mismatches))
+            status = 2
+        else:
+            regressions = compare(results, baseline, args.tolerance, args.min_seconds, args.min_mb)
+            results["regressions"] = regressions
+            for r in regressions:
+                logger.warning("Regression in %s, %s: %s %.4g -> %.4g",
+                               r["case"], r["stage"], r["metric"], r["baseline"], r["current"])
+            status = 1 if regressions else 0
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as writer:
+            writer.write(report + "\n")
+    else:
+        print(report)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
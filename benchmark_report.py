@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Aggregation of the benchmark.py measurements and comparison against a baseline report."""
+
+import statistics
+
+MEMORY_KEYS = ("peak_rss_mb", "rss_growth_mb", "cuda_peak_mb")
+
+
+def summarize(runs, memory):
+    """Merges the timed runs of a case with the stage measurements of its memory pass.
+
+    The time of a stage is its fastest run, which is the least affected by the rest of the machine;
+    `seconds_spread` is the gap between the fastest and the slowest run.
+    """
+    stages = {}
+    for name in runs[0]:
+        times = [run[name]["seconds"] for run in runs]
+        seconds = min(times)
+        items = runs[0][name]["items"]
+        stages[name] = {"seconds": seconds,
+                        "seconds_median": statistics.median(times),
+                        "seconds_spread": max(times) - seconds,
+                        "items": items,
+                        "items_per_second": items / seconds if seconds > 0 else None}
+        for key in MEMORY_KEYS:
+            stages[name][key] = memory.get(name, {}).get(key)
+    return stages
+
+
+def baseline_mismatches(results, baseline):
+    """Lists the settings and environment fields that differ from the baseline.
+
+    The models and datasets may differ: every case runs in its own process, and only the cases present in
+    both reports are compared.
+    """
+    mismatches = []
+    for section in ("settings", "environment"):
+        current = results[section]
+        recorded = baseline.get(section, {})
+        for key in sorted(set(current) | set(recorded)):
+            if section == "settings" and key in ("models", "datasets"):
+                continue
+            if current.get(key) != recorded.get(key):
+                mismatches.append(section + "." + key)
+    return mismatches
+
+
+def compare(results, baseline, tolerance, min_seconds, min_mb):
+    """Lists the stages that got slower, or used more memory, than in the baseline by more than `tolerance`.
+
+    Memory is compared on what the stage itself allocates: its RSS growth and its CUDA peak. The absolute
+    RSS also counts the interpreter and the imported libraries. Differences below `min_mb` are ignored, and
+    so are time differences below `min_seconds` or within the spread of the runs of the stage in the baseline
+    and in the current results, so that run-to-run noise is not reported.
+    """
+    regressions = []
+    for case, current in results["cases"].items():
+        base = baseline.get("cases", {}).get(case, {})
+        if "stages" not in current or "stages" not in base:
+            continue
+        for stage, now in current["stages"].items():
+            before = base["stages"].get(stage)
+            if before is None:
+                continue
+            noise = max(min_seconds, before.get("seconds_spread", 0.0) + now.get("seconds_spread", 0.0))
+            if now["seconds"] > before["seconds"] * (1 + tolerance) and now["seconds"] - before["seconds"] > noise:
+                regressions.append({"case": case, "stage": stage, "metric": "seconds",
+                                    "baseline": before["seconds"], "current": now["seconds"]})
+            for key in ("rss_growth_mb", "cuda_peak_mb"):
+                if now.get(key) is None or before.get(key) is None:
+                    continue
+                if now[key] > before[key] * (1 + tolerance) and now[key] - before[key] > min_mb:
+                    regressions.append({"case": case, "stage": stage, "metric": key,
+                                        "baseline": before[key], "current": now[key]})
+    return regressions
@@ -403,6 +403,109 @@ class DataProcessor():
         return pd.read_csv(input_file, delimiter='\t')
 
 
+def build_dataset(features):
+    """Packs a list of `InputFeatures` into a `TensorDataset`."""
+    all_input_ids = torch.tensor([f.input_ids for f in features], dtype=torch.long)
+    all_input_mask = torch.tensor([f.input_mask for f in features], dtype=torch.long)
+    all_segment_ids = torch.tensor([f.segment_ids for f in features], dtype=torch.long)
+    all_label_ids = torch.tensor([f.label_ids for f in features], dtype=torch.long)
+    return TensorDataset(all_input_ids, all_input_mask, all_segment_ids, all_label_ids)
+
+
+def build_optimizer(model, learning_rate):
+    """Creates the AdamW optimizer, without weight decay on biases and LayerNorm weights."""
+    param_optimizer = list(model.named_parameters())
+    no_decay = ['bias', 'gamma', 'beta']
+    optimizer_grouped_parameters = [
+        {'params': [p for n, p in param_optimizer if not any(nd in n for nd in no_decay)],
+        'weight_decay_rate': 0.01},
+        {'params': [p for n, p in param_optimizer if any(nd in n for nd in no_decay)],
+        'weight_decay_rate': 0.0}
+    ]
+
+    # This variable contains all of the hyperparemeter information that the training loop needs
+    return AdamW(optimizer_grouped_parameters,
+                 lr=learning_rate)
+
+
+def train(model, train_dataloader, optimizer, num_train_epochs, device):
+    """Fine-tunes the model. Returns the global step and the mean loss of the last epoch."""
+    global_step = 0
+    nb_tr_steps = 0
+    tr_loss = 0
+    model.train()
+    for _ in trange(int(num_train_epochs), desc="Epoch"):
+        tr_loss = 0
+        nb_tr_examples, nb_tr_steps = 0, 0
+        for step, batch in enumerate(tqdm(train_dataloader, desc="Iteration")):
+            batch = tuple(t.to(device) for t in batch)
+            input_ids, input_mask, segment_ids, label_ids = batch
+            outputs = model(input_ids = input_ids, token_type_ids = segment_ids, attention_mask = input_mask, labels = label_ids)
+            loss = outputs[0]
+            loss.backward()
+
+            tr_loss += loss.item()
+            nb_tr_examples += input_ids.size(0)
+            nb_tr_steps += 1
+            global_step += 1
+            optimizer.step()
+            optimizer.zero_grad()
+    return global_step, tr_loss / nb_tr_steps
+
+
+def evaluate(model, eval_dataloader, device, gpu, multi_label, T):
+    """Runs prediction on the eval data. Returns the eval loss, the predictions and the gold labels.
+
+    For multi-label classification a label is predicted when its probability is greater than or equal to `T`.
+    """
+    model.eval()
+    eval_loss, eval_accuracy = 0, 0
+    nb_eval_steps, nb_eval_examples = 0, 0
+    preds = None
+    out_label_ids = None
+    for input_ids, input_mask, segment_ids, label_ids in tqdm(eval_dataloader, desc="Evaluating"):
+        input_ids = input_ids.to(device)
+        input_mask = input_mask.to(device)
+        segment_ids = segment_ids.to(device)
+        label_ids = label_ids.to(device)
+
+        with torch.no_grad():
+            outputs = model(input_ids = input_ids, token_type_ids = segment_ids, attention_mask = input_mask, labels = label_ids)[:2]
+            #logits = model(input_ids = input_ids, token_type_ids = segment_ids, attention_mask = input_mask)
+            tmp_eval_loss = outputs[0]
+            logits = outputs[1]
+            eval_loss += tmp_eval_loss.mean().item()
+        nb_eval_steps += 1
+        if preds is None:
+            if gpu == -1:
+                preds = logits.numpy()
+                out_label_ids = label_ids.numpy()
+            else:
+                preds = logits.detach().cpu().numpy()
+                out_label_ids = label_ids.detach().cpu().numpy()
+        else:
+            if gpu == -1:
+                preds = np.append(preds, logits.numpy(), axis=0)
+                out_label_ids = np.append(out_label_ids, label_ids.numpy(), axis=0)
+            else:
+                preds = np.append(preds, logits.detach().cpu().numpy(), axis=0)
+                out_label_ids = np.append(out_label_ids, label_ids.detach().cpu().numpy(), axis=0)
+
+    eval_loss = eval_loss / nb_eval_steps
+
+    if multi_label:
+        probs = torch.sigmoid(torch.from_numpy(preds))
+        # If probability greater than or equal to threshold T the tweet contains that emotion
+        preds = (probs >= T).type(torch.FloatTensor)
+        if gpu == -1:
+            preds = preds.numpy()
+        else:
+            preds = preds.detach().cpu().numpy()
+    else:
+        preds = np.argmax(preds, axis=1)
+    return eval_loss, preds, out_label_ids
+
+
 def main():
     parser = argparse.ArgumentParser()
 
@@ -516,10 +619,6 @@ def main():
     train_features = convert_examples_to_features(
         train_examples, labels, args.max_seq_length, tokenizer, gpt2=args.model=="gpt2")
 
-    all_input_ids = torch.tensor([f.input_ids for f in train_features], dtype=torch.long)
-    all_input_mask = torch.tensor([f.input_mask for f in train_features], dtype=torch.long)
-    all_segment_ids = torch.tensor([f.segment_ids for f in train_features], dtype=torch.long)
-    all_label_ids = torch.tensor([f.label_ids for f in train_features], dtype=torch.long)
     all_labels = [i.labels for i in train_examples]+[i.labels for i in eval_examples]
 
     multi_label = False
@@ -544,103 +643,22 @@ def main():
         model.gpt2.resize_token_embeddings(len(tokenizer))
         model.set_type(args.gpt2_classification_type)
     model.to(device)
-    train_data = TensorDataset(all_input_ids, all_input_mask, all_segment_ids, all_label_ids)
+    train_data = build_dataset(train_features)
     train_sampler = RandomSampler(train_data)
     train_dataloader = DataLoader(train_data, sampler=train_sampler, batch_size=args.train_batch_size)
-    global_step = 0
-    nb_tr_steps = 0
-    tr_loss = 0
-    model.train()
-    T = args.prob_threshold
-    param_optimizer = list(model.named_parameters())
-    no_decay = ['bias', 'gamma', 'beta']
-    optimizer_grouped_parameters = [
-        {'params': [p for n, p in param_optimizer if not any(nd in n for nd in no_decay)],
-        'weight_decay_rate': 0.01},
-        {'params': [p for n, p in param_optimizer if any(nd in n for nd in no_decay)],
-        'weight_decay_rate': 0.0}
-    ]
-
-    # This variable contains all of the hyperparemeter information that the training loop needs
-    optimizer = AdamW(optimizer_grouped_parameters,
-                        lr=args.learning_rate)
-    for _ in trange(int(args.num_train_epochs), desc="Epoch"):
-        tr_loss = 0
-        nb_tr_examples, nb_tr_steps = 0, 0
-        for step, batch in enumerate(tqdm(train_dataloader, desc="Iteration")):
-            batch = tuple(t.to(device) for t in batch)
-            input_ids, input_mask, segment_ids, label_ids = batch
-            outputs = model(input_ids = input_ids, token_type_ids = segment_ids, attention_mask = input_mask, labels = label_ids)
-            loss = outputs[0]
-            loss.backward()
-
-            tr_loss += loss.item()
-            nb_tr_examples += input_ids.size(0)
-            nb_tr_steps += 1
-            global_step += 1
-            optimizer.step()
-            optimizer.zero_grad()
+    optimizer = build_optimizer(model, args.learning_rate)
+    global_step, loss = train(model, train_dataloader, optimizer, args.num_train_epochs, device)
 
     eval_features = convert_examples_to_features(
         eval_examples, labels, args.max_seq_length, tokenizer)
     logger.info("***** Running evaluation *****")
     logger.info("  Num examples = %d", len(eval_examples))
     logger.info("  Batch size = %d", args.eval_batch_size)
-    all_input_ids = torch.tensor([f.input_ids for f in eval_features], dtype=torch.long)
-    all_input_mask = torch.tensor([f.input_mask for f in eval_features], dtype=torch.long)
-    all_segment_ids = torch.tensor([f.segment_ids for f in eval_features], dtype=torch.long)
-    all_label_ids = torch.tensor([f.label_ids for f in eval_features], dtype=torch.long)
-    eval_data = TensorDataset(all_input_ids, all_input_mask, all_segment_ids, all_label_ids)
+    eval_data = build_dataset(eval_features)
     # Run prediction for full data
     eval_sampler = SequentialSampler(eval_data)
     eval_dataloader = DataLoader(eval_data, sampler=eval_sampler, batch_size=args.eval_batch_size)
-
-    model.eval()
-    eval_loss, eval_accuracy = 0, 0
-    nb_eval_steps, nb_eval_examples = 0, 0
-    preds = None
-    out_label_ids = None
-    for input_ids, input_mask, segment_ids, label_ids in tqdm(eval_dataloader, desc="Evaluating"):
-        input_ids = input_ids.to(device)
-        input_mask = input_mask.to(device)
-        segment_ids = segment_ids.to(device)
-        label_ids = label_ids.to(device)
-
-        with torch.no_grad():
-            outputs = model(input_ids = input_ids, token_type_ids = segment_ids, attention_mask = input_mask, labels = label_ids)[:2]
-            #logits = model(input_ids = input_ids, token_type_ids = segment_ids, attention_mask = input_mask)
-            tmp_eval_loss = outputs[0]
-            logits = outputs[1]
-            eval_loss += tmp_eval_loss.mean().item()
-        nb_eval_steps += 1
-        if preds is None:
-            if gpu == -1:
-                preds = logits.numpy()
-                out_label_ids = label_ids.numpy()
-            else:
-                preds = logits.detach().cpu().numpy()
-                out_label_ids = label_ids.detach().cpu().numpy()
-        else:
-            if gpu == -1:
-                preds = np.append(preds, logits.numpy(), axis=0)
-                out_label_ids = np.append(out_label_ids, label_ids.numpy(), axis=0)
-            else:
-                preds = np.append(preds, logits.detach().cpu().numpy(), axis=0)
-                out_label_ids = np.append(out_label_ids, label_ids.detach().cpu().numpy(), axis=0)
-
-    eval_loss = eval_loss / nb_eval_steps
-
-    if multi_label:
-        probs = torch.sigmoid(torch.from_numpy(preds))
-        # If probability greater than or equal to threshold T the tweet contains that emotion
-        preds = (probs >= T).type(torch.FloatTensor)
-        if gpu == -1:
-            preds = preds.numpy()
-        else:
-            preds = preds.detach().cpu().numpy()
-    else:
-        preds = np.argmax(preds, axis=1)
-    loss = tr_loss / nb_tr_steps
+    eval_loss, preds, out_label_ids = evaluate(model, eval_dataloader, device, gpu, multi_label, args.prob_threshold)
 
     results = {'eval_loss': eval_loss,
                'global_step': global_step,
@@ -0,0 +1,56 @@
+import math
+import os
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+pytest.importorskip("pandas")
+pytest.importorskip("sklearn")
+
+import benchmark
+from benchmark_report import MEMORY_KEYS
+
+STAGES = ["read", "labels", "train_features", "model_init", "train", "eval_features", "eval", "metrics"]
+
+
+@pytest.fixture(scope="module")
+def bert_tokenizer(tmp_path_factory):
+    out_dir = str(tmp_path_factory.mktemp("bert"))
+    train_file = os.path.join(benchmark.ROOT, "multilabel_sample", "train.tsv")
+    texts = [str(example.text_a) for example in benchmark.DataProcessor().get_train_examples(train_file)]
+    benchmark.write_bert_vocab(texts, out_dir, 500)
+    return benchmark.load_tokenizer("bert", out_dir)
+
+
+@pytest.fixture(scope="module")
+def args():
+    return benchmark.build_parser().parse_args([
+        "--max_train_examples", "16", "--max_eval_examples", "16", "--max_seq_length", "16",
+        "--train_batch_size", "8", "--eval_batch_size", "8", "--hidden_size", "8"])
+
+
+@pytest.mark.parametrize("dataset", ["binary_sample", "multilabel_sample"])
+def test_run_case_times_every_stage(dataset, bert_tokenizer, args):
+    device = benchmark.setup(args)
+    stages, scores = benchmark.run_case("bert", dataset, bert_tokenizer, device, args)
+    assert list(stages) == STAGES
+    for stage in stages.values():
+        assert stage["seconds"] >= 0
+        assert stage["items"] > 0
+    assert stages["train"]["items"] == 16
+    assert stages["eval"]["items"] == 16
+    assert scores["global_step"] == 2
+    assert math.isfinite(scores["loss"])
+    assert math.isfinite(scores["eval_loss"])
+
+
+def test_run_case_measures_memory_of_every_stage(bert_tokenizer, args):
+    device = benchmark.setup(args)
+    stages, scores = benchmark.run_case("bert", "multilabel_sample", bert_tokenizer, device, args,
+                                        measure_memory=True)
+    assert list(stages) == STAGES
+    for stage in stages.values():
+        assert set(stage) == set(MEMORY_KEYS)
+        assert stage["cuda_peak_mb"] is None
+    assert math.isfinite(scores["loss"])
@@ -0,0 +1,75 @@
+from benchmark_report import summarize, compare, baseline_mismatches
+
+
+def stage(seconds, rss_growth_mb=10.0, cuda_peak_mb=None, items=100):
+    return {"seconds": seconds, "items": items, "items_per_second": items / seconds,
+            "peak_rss_mb": 500.0, "rss_growth_mb": rss_growth_mb, "cuda_peak_mb": cuda_peak_mb}
+
+
+def report(**stages):
+    return {"cases": {"bert/binary_sample": {"stages": stages}}}
+
+
+def regressions(results, baseline):
+    return compare(results, baseline, tolerance=0.2, min_seconds=0.05, min_mb=5.0)
+
+
+def test_summarize_takes_fastest_time_and_memory_pass():
+    runs = [{"train": stage(3.0)}, {"train": stage(1.0)}, {"train": stage(2.0)}]
+    memory = {"train": {"peak_rss_mb": 600.0, "rss_growth_mb": 12.0, "cuda_peak_mb": None}}
+    stages = summarize(runs, memory)
+    assert stages["train"]["seconds"] == 1.0
+    assert stages["train"]["seconds_median"] == 2.0
+    assert stages["train"]["seconds_spread"] == 2.0
+    assert stages["train"]["items_per_second"] == 100.0
+    assert stages["train"]["rss_growth_mb"] == 12.0
+    assert stages["train"]["cuda_peak_mb"] is None
+
+
+def test_compare_reports_slowdown_beyond_tolerance():
+    assert regressions(report(train=stage(1.3)), report(train=stage(1.0))) == [
+        {"case": "bert/binary_sample", "stage": "train", "metric": "seconds", "baseline": 1.0, "current": 1.3}]
+
+
+def test_compare_ignores_slowdown_within_tolerance_or_below_min_seconds():
+    baseline = report(train=stage(1.0), metrics=stage(0.01))
+    assert regressions(report(train=stage(1.1), metrics=stage(0.03)), baseline) == []
+
+
+def test_compare_ignores_slowdown_within_the_spread_of_the_runs():
+    baseline = report(labels=dict(stage(0.6), seconds_spread=0.2))
+    results = report(labels=dict(stage(0.8), seconds_spread=0.1))
+    assert regressions(results, baseline) == []
+    results = report(labels=dict(stage(0.95), seconds_spread=0.1))
+    assert [r["stage"] for r in regressions(results, baseline)] == ["labels"]
+
+
+def test_compare_reports_memory_growth_of_the_stage():
+    baseline = report(eval=stage(1.0, rss_growth_mb=10.0, cuda_peak_mb=100.0))
+    results = report(eval=stage(1.0, rss_growth_mb=30.0, cuda_peak_mb=103.0))
+    assert [(r["stage"], r["metric"]) for r in regressions(results, baseline)] == [("eval", "rss_growth_mb")]
+
+
+def test_compare_ignores_small_memory_growth():
+    baseline = report(eval=stage(1.0, rss_growth_mb=1.0))
+    assert regressions(report(eval=stage(1.0, rss_growth_mb=4.0)), baseline) == []
+
+
+def test_compare_skips_missing_memory_stages_and_cases():
+    baseline = report(train=stage(1.0, rss_growth_mb=None))
+    baseline["cases"]["gpt2/multilabel_sample"] = {"skipped": "reason"}
+    results = report(train=stage(1.0, rss_growth_mb=50.0), eval=stage(9.0))
+    results["cases"]["gpt2/multilabel_sample"] = {"skipped": "reason"}
+    results["cases"]["xlnet/binary_sample"] = {"stages": {"train": stage(9.0)}}
+    assert regressions(results, baseline) == []
+
+
+def test_baseline_mismatches_ignore_models_and_datasets():
+    baseline = {"settings": {"models": ["bert", "gpt2"], "datasets": ["binary_sample"], "repeats": 5},
+                "environment": {"torch": "2.4.0"}}
+    results = {"settings": {"models": ["gpt2"], "datasets": ["binary_sample"], "repeats": 5},
+               "environment": {"torch": "2.4.0"}}
+    assert baseline_mismatches(results, baseline) == []
+    results = {"settings": {"models": ["gpt2"], "datasets": ["binary_sample"], "repeats": 3},
+               "environment": {"torch": "2.5.0"}}
+    assert baseline_mismatches(results, baseline) == ["settings.repeats", "environment.torch"]